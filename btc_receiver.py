@@ -20,6 +20,29 @@ class BtcReceiver:
         self.fail_count = 0
         self.last_email_sent = None
 
+    def get_state(self) -> dict:
+        """Returns the state to be saved in the checkpoint file."""
+        return {
+            "price": self.price,
+            "fail_count": self.fail_count,
+            "last_email_sent": None if self.last_email_sent is None
+                else self.last_email_sent.isoformat()}
+
+    def load_state(self, state: dict, fresh: bool = True) -> None:
+        """
+        Restores the state returned by get_state().
+        The time of the last email is always restored so the alert is not
+        sent again after a restart. The last known price and the fail count
+        are only restored if the checkpoint is fresh.
+        """
+        if state.get("last_email_sent"):
+            self.last_email_sent = \
+                datetime.fromisoformat(state["last_email_sent"])
+        if not fresh:
+            return
+        self.price = state.get("price")
+        self.fail_count = state.get("fail_count", 0)
+
     def get_price(self) -> float | None:
         """
         Fetches the current price of Bitcoin in USD from Binance API.
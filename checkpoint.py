@@ -0,0 +1,47 @@
+import os
+import json
+from dotenv import load_dotenv
+from datetime import datetime
+
+from logger import logger
+
+
+load_dotenv()
+P_CHECKPOINT_PATH = os.getenv("P_CHECKPOINT_PATH")
+# checkpoints older than this many seconds only restore alert state
+P_CHECKPOINT_MAX_AGE = int(os.getenv("P_CHECKPOINT_MAX_AGE", "300"))
+
+
+def save_checkpoint(state: dict, path: str = P_CHECKPOINT_PATH) -> bool:
+    """
+    Write the state to the checkpoint file. The file is replaced atomically,
+    so a crash while saving leaves the previous checkpoint intact.
+    """
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump({"saved_at": datetime.now().isoformat(),
+                       "state": state}, f)
+        os.replace(path + ".tmp", path)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to save checkpoint: {e}")
+        return False
+
+
+def load_checkpoint(path: str = P_CHECKPOINT_PATH) -> tuple[dict, float] | None:
+    """
+    Read the checkpoint file.
+    Returns the state and its age in seconds, or None if there is no
+    readable checkpoint.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+        saved_at = datetime.fromisoformat(checkpoint["saved_at"])
+        return checkpoint["state"], \
+            (datetime.now() - saved_at).total_seconds()
+    except Exception as e:
+        logger.error(f"Failed to load checkpoint: {e}")
+        return None
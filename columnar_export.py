@@ -0,0 +1,278 @@
+import os
+import json
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import pyarrow.compute as pc
+from dotenv import load_dotenv
+from datetime import datetime, timedelta
+
+from logger import logger
+from db_utils import DBUtils, Tables
+
+
+load_dotenv()
+P_EXPORT_PATH = os.getenv("P_EXPORT_PATH")
+
+PRICE_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("s")),
+    ("price", pa.float64())])
+INDICATOR_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("s")),
+    ("indicator_name", pa.dictionary(pa.int16(), pa.string())),
+    ("value", pa.float64()),
+    ("signal", pa.dictionary(pa.int8(), pa.string()))])
+
+# file extension per export format
+FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+WATERMARK_FILE = "_watermark.json"
+# name of the file of each day partition
+DAY_FILE = "data"
+
+
+def _to_float(value) -> float | None:
+    """NUMERIC columns come back as Decimal, store them as float64."""
+    return None if value is None else float(value)
+
+
+class ColumnarExporter:
+    """
+    This class is responsible for exporting database tables to columnar files
+    so analysis does not need to query the production database.
+    export() dumps the rows added since the last export into day partitioned
+    files at <export_path>/<table>/<YYYY-MM-DD>/data.<arrow|parquet>.
+    Indicator names and signals are dictionary encoded.
+    Only finished minutes are exported, so a minute that is still being
+    written is picked up by the next export instead of being lost.
+    """
+
+    def __init__(self, export_path: str = P_EXPORT_PATH, fmt: str = "arrow",
+                 db: DBUtils | None = None) -> None:
+        if fmt not in FORMATS:
+            raise ValueError(f"Invalid format: {fmt}")
+        self.export_path = export_path
+        self.fmt = fmt
+        self.db = db if db is not None else DBUtils()
+
+    def table_dir(self, table: Tables) -> str:
+        return os.path.join(self.export_path, table.value)
+
+    def get_watermark(self, table: Tables) -> datetime | None:
+        """Get the timestamp of the last exported row of the table."""
+        path = os.path.join(self.table_dir(table), WATERMARK_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return datetime.fromisoformat(json.load(f)["timestamp"])
+
+    def set_watermark(self, table: Tables, ts: datetime) -> None:
+        """Atomically store the timestamp of the last exported row."""
+        path = os.path.join(self.table_dir(table), WATERMARK_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"timestamp": ts.isoformat()}, f)
+        os.replace(path + ".tmp", path)
+
+    def write_file(self, batch: pa.Table, path: str) -> None:
+        """Write the batch to path through a temporary file."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.fmt == "arrow":
+            # uncompressed so the reader can memory map it without copying
+            with pa.OSFile(path + ".tmp", "wb") as sink:
+                with ipc.new_file(sink, batch.schema) as writer:
+                    writer.write_table(batch)
+        else:
+            pq.write_table(batch, path + ".tmp",
+                           use_dictionary=["indicator_name", "signal"])
+        os.replace(path + ".tmp", path)
+
+    def to_arrow(self, table: Tables, rows: list) -> pa.Table:
+        """Convert database rows to an arrow table of the table's schema."""
+        if table == Tables.BTC_PRICE:
+            return pa.table({
+                "timestamp": pa.array([r[0] for r in rows], pa.timestamp("s")),
+                "price": pa.array([_to_float(r[1]) for r in rows],
+                                  pa.float64())},
+                schema=PRICE_SCHEMA)
+        return pa.table({
+            "timestamp": pa.array([r[0] for r in rows], pa.timestamp("s")),
+            "indicator_name": pa.array([r[1] for r in rows]).dictionary_encode()
+                .cast(INDICATOR_SCHEMA.field("indicator_name").type),
+            "value": pa.array([_to_float(r[2]) for r in rows], pa.float64()),
+            "signal": pa.array([r[3] for r in rows], pa.string())
+                .dictionary_encode()
+                .cast(INDICATOR_SCHEMA.field("signal").type)},
+            schema=INDICATOR_SCHEMA)
+
+    def export_table(self, table: Tables, end: datetime) -> int:
+        """
+        Export rows of the table newer than the watermark and older than end.
+        Rows are queried one day at a time, so the first export of a long
+        history does not load the whole table at once. New rows of a day are
+        merged into the day's file, so every day has a single file however
+        often the export runs. If a query fails, the export stops there and
+        the watermark stays at the last day that was read.
+        Returns the number of exported rows.
+        """
+        after = self.get_watermark(table)
+        if after is None:
+            first_ts = self.db.get_first_timestamp(table)
+            if first_ts is None:
+                return 0
+            # get_*_between excludes the lower bound
+            after = first_ts - timedelta(seconds=1)
+
+        schema = PRICE_SCHEMA if table == Tables.BTC_PRICE \
+            else INDICATOR_SCHEMA
+        exported = 0
+        day_start = datetime.combine(after.date(), datetime.min.time())
+        while day_start < end:
+            day_end = min(day_start + timedelta(days=1), end)
+            # get_*_between excludes the lower bound
+            lower = max(after, day_start - timedelta(seconds=1))
+            if table == Tables.BTC_PRICE:
+                rows = self.db.get_prices_between(lower, day_end)
+            else:
+                rows = self.db.get_indicators_between(table, lower, day_end)
+            if rows is None:
+                logger.error(f"Failed to export {table.value} from "
+                             f"{day_start.date()}, will retry on next export.")
+                break
+            if rows:
+                path = os.path.join(self.table_dir(table),
+                                    day_start.strftime("%Y-%m-%d"),
+                                    DAY_FILE + FORMATS[self.fmt])
+                data = self.to_arrow(table, rows)
+                if os.path.exists(path):
+                    data = pa.concat_tables([
+                        HistoryReader.read_file(path, schema), data])
+                self.write_file(data, path)
+                self.set_watermark(table, rows[-1][0])
+                exported += len(rows)
+            day_start += timedelta(days=1)
+        return exported
+
+    def export(self, tables: list[Tables] | None = None) -> dict[Tables, int]:
+        """
+        Export new rows of the given tables, all tables by default.
+        Returns the number of exported rows per table.
+        """
+        if tables is None:
+            tables = list(Tables)
+        end = datetime.now().replace(second=0, microsecond=0)
+        exported = {}
+        for table in tables:
+            try:
+                exported[table] = self.export_table(table, end)
+            except Exception as e:
+                logger.error(f"Failed to export {table.value}: {e}")
+                exported[table] = 0
+        return exported
+
+
+class HistoryReader:
+    """
+    This class reads the files written by ColumnarExporter.
+    Arrow files are memory mapped, so only the pages that are actually used
+    are loaded from disk. Day partitions outside of the requested time range
+    are not opened at all.
+    """
+
+    def __init__(self, export_path: str = P_EXPORT_PATH) -> None:
+        self.export_path = export_path
+
+    def partition_files(self, table: Tables, start: datetime | None,
+                        end: datetime | None) -> list[str]:
+        """List the files of the day partitions overlapping [start, end)."""
+        table_dir = os.path.join(self.export_path, table.value)
+        if not os.path.isdir(table_dir):
+            return []
+        files = []
+        for day in sorted(os.listdir(table_dir)):
+            day_dir = os.path.join(table_dir, day)
+            if not os.path.isdir(day_dir):
+                continue
+            day_start = datetime.strptime(day, "%Y-%m-%d")
+            if start is not None and day_start + timedelta(days=1) <= start:
+                continue
+            if end is not None and day_start >= end:
+                continue
+            files.extend(os.path.join(day_dir, name)
+                         for name in sorted(os.listdir(day_dir))
+                         if os.path.splitext(name)[1] in FORMATS.values())
+        return files
+
+    @staticmethod
+    def read_file(path: str, schema: pa.Schema) -> pa.Table:
+        """
+        Read an exported file. Parquet does not keep the second resolution
+        and dictionary index types, so the result is cast to the schema.
+        """
+        if path.endswith(FORMATS["arrow"]):
+            data = ipc.open_file(pa.memory_map(path)).read_all()
+        else:
+            data = pq.read_table(path, memory_map=True,
+                read_dictionary=[name for name in schema.names
+                                 if pa.types.is_dictionary(
+                                     schema.field(name).type)])
+        if data.schema.equals(schema):
+            return data
+        return data.cast(schema)
+
+    def read(self, table: Tables, start: datetime | None = None,
+             end: datetime | None = None,
+             indicators: list[str] | None = None) -> dict[str, pa.ChunkedArray]:
+        """
+        Read the rows of the table with start <= timestamp < end.
+        For indicator tables, rows can be filtered by indicator names.
+        Returns a dict of column name to column array.
+        """
+        schema = PRICE_SCHEMA if table == Tables.BTC_PRICE \
+            else INDICATOR_SCHEMA
+        files = self.partition_files(table, start, end)
+        if files:
+            data = pa.concat_tables([self.read_file(f, schema) for f in files])
+        else:
+            data = schema.empty_table()
+
+        mask = None
+        if start is not None:
+            mask = pc.greater_equal(data["timestamp"], pa.scalar(
+                start, pa.timestamp("s")))
+        if end is not None:
+            end_mask = pc.less(data["timestamp"], pa.scalar(
+                end, pa.timestamp("s")))
+            mask = end_mask if mask is None else pc.and_(mask, end_mask)
+        if indicators is not None and table != Tables.BTC_PRICE:
+            name_mask = pc.is_in(data["indicator_name"],
+                                 value_set=pa.array(indicators, pa.string()))
+            mask = name_mask if mask is None else pc.and_(mask, name_mask)
+        if mask is not None:
+            data = data.filter(mask)
+        return {name: data[name] for name in data.column_names}
+
+    def read_prices(self, start: datetime | None = None,
+                    end: datetime | None = None) -> dict[str, pa.ChunkedArray]:
+        """Read btc prices with start <= timestamp < end."""
+        return self.read(Tables.BTC_PRICE, start, end)
+
+    def read_indicators(self, table: Tables, start: datetime | None = None,
+                        end: datetime | None = None,
+                        indicators: list[str] | None = None
+                        ) -> dict[str, pa.ChunkedArray]:
+        """Read indicators of the table with start <= timestamp < end."""
+        return self.read(table, start, end, indicators)
+
+
+if __name__ == "__main__":
+    exporter = ColumnarExporter()
+    for table, count in exporter.export().items():
+        print(f"{table.value}: {count} rows exported.")
+    exporter.db.close()
+
+    reader = HistoryReader()
+    end = datetime.now()
+    prices = reader.read_prices(end - timedelta(days=1), end)
+    print(f"Prices in the last day: {len(prices['timestamp'])}")
+    rsi = reader.read_indicators(Tables.INDICATOR_1MIN,
+        end - timedelta(days=1), end, ["Relative Strength Index (14)"])
+    print(f"RSI values in the last day: {len(rsi['timestamp'])}")
@@ -1,12 +1,26 @@
+import os
+import json
 import time
 import signal
 import requests
+from dotenv import load_dotenv
 from datetime import datetime
 
 from logger import logger
 from db_utils import DBUtils, Tables
 from btc_receiver import BtcReceiver
 from indicator_receiver import IndicatorReceiver
+from leader_election import LeaderElection, P_HA_LOCK_KEY, \
+    STANDBY_RETRY_SECONDS
+from checkpoint import save_checkpoint, load_checkpoint, \
+    P_CHECKPOINT_PATH, P_CHECKPOINT_MAX_AGE
+
+
+load_dotenv()
+P_CAPTURE_PATH = os.getenv("P_CAPTURE_PATH")
+# a standby that becomes leader, or a process restarted from a fresh
+# checkpoint, until this second still logs the current minute
+TAKEOVER_DEADLINE = 20
 
 
 # Define a timeout exception
@@ -48,13 +62,60 @@ class DataLogger:
     It fetches the current price of Bitcoin and the status of indicators
     and logs them to the database. Runs forever and every minute.
     Database tables primary key is timestamp and YYYY-MM-DD HH:MM:00 format.
+    If P_HA_LOCK_KEY is set, several instances can run against the same
+    database and only the one holding the advisory lock writes each minute.
+    If P_CAPTURE_PATH is set, the raw data of every minute is appended to
+    that file as a json line, which can be replayed later with replay.py.
+    If P_CHECKPOINT_PATH is set, the receivers' state is saved every minute
+    and restored at startup, so last known values and alert times survive
+    a restart.
+    Receivers and database can be passed in, which replay.py uses to feed
+    recorded data through the same parse and persist path.
     """
 
-    def __init__(self) -> None:
-        self.btc_receiver = BtcReceiver()
-        self.indicator_receiver = IndicatorReceiver()
-        self.db = DBUtils()
+    def __init__(self, btc_receiver: BtcReceiver | None = None,
+                 indicator_receiver: IndicatorReceiver | None = None,
+                 db: DBUtils | None = None) -> None:
+        self.btc_receiver = btc_receiver if btc_receiver is not None \
+            else BtcReceiver()
+        self.indicator_receiver = indicator_receiver \
+            if indicator_receiver is not None else IndicatorReceiver()
+        self.db = db if db is not None else DBUtils()
         self.tables = Tables
+        # set by restore_state() to log the current minute without waiting
+        self.catch_up = False
+        self.leader_election = LeaderElection(P_HA_LOCK_KEY) \
+            if P_HA_LOCK_KEY else None
+
+    def is_leader(self) -> bool:
+        """Check if this instance should write to the database."""
+        if self.leader_election is None:
+            return True
+        return self.leader_election.try_acquire()
+
+    def save_state(self) -> bool:
+        """Save the receivers' state to the checkpoint file."""
+        return save_checkpoint({
+            "btc_receiver": self.btc_receiver.get_state(),
+            "indicator_receiver": self.indicator_receiver.get_state()})
+
+    def restore_state(self) -> None:
+        """
+        Restore the receivers' state from the checkpoint file.
+        Checkpoints older than P_CHECKPOINT_MAX_AGE seconds only restore
+        the email times.
+        """
+        checkpoint = load_checkpoint()
+        if checkpoint is None:
+            return
+        state, age = checkpoint
+        fresh = age <= P_CHECKPOINT_MAX_AGE
+        self.catch_up = fresh
+        self.btc_receiver.load_state(state.get("btc_receiver", {}), fresh)
+        self.indicator_receiver.load_state(
+            state.get("indicator_receiver", {}), fresh)
+        logger.info(f"Restored {'fresh' if fresh else 'stale'} checkpoint "
+                    f"saved {age:.0f} seconds ago.")
 
     def format_timestamp(self, ts: datetime) -> datetime:
         """
@@ -109,43 +170,104 @@ class DataLogger:
         indicators = self.indicator_receiver.get_indicators()
         return price, indicators
 
+    def parse_data(self, ts: datetime, price: float | None,
+                   indicators: dict) -> tuple[datetime, float | None, dict]:
+        """
+        Convert the raw receiver data of a minute to the database format:
+        (timestamp, price, {table: [(indicator_name, value, signal)]}).
+        """
+        rows = {}
+        for interval, status in indicators.items():
+            table = self.interval_to_table(interval)
+            if table is None:
+                continue
+            rows[table] = []
+            for indicator, t in status.items():
+                if t is None:
+                    t = (None, None)
+                try:
+                    value = float(t[0].replace('−', '-').replace(',', '.'))
+                except Exception as e:
+                    value = None
+                if t[1] not in ['Buy', 'Sell', 'Neutral']:
+                    signal_ = None
+                else:
+                    signal_ = t[1]
+                rows[table].append((indicator, value, signal_))
+        return ts, price, rows
+
+    def capture_data(self, ts: datetime, price: float | None,
+                     indicators: dict) -> None:
+        """Append the raw data of the minute to the capture file."""
+        try:
+            with open(P_CAPTURE_PATH, "a") as f:
+                f.write(json.dumps({"timestamp": ts.isoformat(),
+                    "price": price, "indicators": indicators}) + "\n")
+        except Exception as e:
+            logger.error(f"Failed to capture data: {e}")
+
     def log_data(self) -> None:
         """
         Fetches the current price of Bitcoin and the status of indicators
         and logs them to the database.
         """
-        # wait until next minute start
+        # wait until next minute start, unless just restarted from a fresh
+        # checkpoint with enough time left to log the current minute
         print(11, datetime.now())
-        while datetime.now().second > 5:
-            time.sleep(0.01)
+        if not (self.catch_up and
+                datetime.now().second <= TAKEOVER_DEADLINE):
+            while datetime.now().second > 5:
+                time.sleep(0.01)
+        self.catch_up = False
         print(22, datetime.now())
+        # standby instances retry every few seconds, so a dead leader is
+        # replaced without waiting for the next minute
+        if not self.is_leader():
+            print("Standby, another instance is logging.")
+            while not self.is_leader():
+                time.sleep(STANDBY_RETRY_SECONDS)
+            if datetime.now().second > TAKEOVER_DEADLINE:
+                # too late for this minute, start with the next one
+                return
         # check internet connection
         try:
             requests.get("https://www.google.com", timeout=5)
         except requests.ConnectionError:
             logger.error("No internet connection.")
             print("No internet connection.")
+            if self.leader_election is not None:
+                # a standby may still be able to log this minute
+                self.leader_election.release("no internet connection.")
             time.sleep(5)
             return
+        if self.leader_election is not None:
+            self.leader_election.start_work()
         st_ = datetime.now()
         formatted_ts = self.format_timestamp(datetime.now())
-        price, indicators = self.get_data()
+        # a minute taken over from a dead leader or caught up after a restart
+        # has less time left
+        price, indicators = self.get_data(
+            timeout=min(50, 55 - datetime.now().second))
         print(f"Price: {price}, Indicators: {indicators}")
+        if P_CAPTURE_PATH:
+            self.capture_data(formatted_ts, price, indicators)
+        # leadership may be lost while fetching data, also when the watchdog
+        # released it because fetching hung
+        if self.leader_election is not None and \
+                not self.leader_election.is_still_leader():
+            logger.error(f"Lost leadership, skipping {formatted_ts}.")
+            self.leader_election.finish_work()
+            return
 
-        self.db.add_price(formatted_ts, price)
-
-        for interval, status in indicators.items():
-            for indicator, t in status.items():
-                try:
-                    value = float(t[0].replace('−', '-').replace(',', '.'))
-                except Exception as e:
-                    value = None
-                if t[1] not in ['Buy', 'Sell', 'Neutral']:
-                    signal_ = None
-                else:
-                    signal_ = t[1]
-                self.db.add_indicator(self.interval_to_table(interval),
-                    formatted_ts, indicator, value, signal_)
+        written = self.db.add_snapshots(
+            [self.parse_data(formatted_ts, price, indicators)])
+        if self.leader_election is not None:
+            self.leader_election.finish_work()
+            if not written:
+                self.leader_election.release(
+                    f"failed to write {formatted_ts}.")
+        if P_CHECKPOINT_PATH:
+            self.save_state()
         loop_time = datetime.now() - st_
         if loop_time.total_seconds() < 5:
             time.sleep(5 - loop_time.total_seconds())
@@ -153,5 +275,7 @@ class DataLogger:
 
 if __name__ == "__main__":
     data_logger = DataLogger()
+    if P_CHECKPOINT_PATH:
+        data_logger.restore_state()
     while True:
         data_logger.log_data()
@@ -3,6 +3,7 @@ import psycopg2
 from enum import Enum
 from time import sleep
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 from datetime import datetime as timestamp
 
@@ -18,6 +19,10 @@ P_HOST = os.getenv("P_HOST")
 P_PORT = os.getenv("P_PORT")
 
 
+# price of a snapshot without a btc_price row, None is stored as NULL
+NO_PRICE = object()
+
+
 class Tables(Enum):
     BTC_PRICE = "btc_price"
     INDICATOR_1MIN = "indicator_1min"
@@ -33,14 +38,15 @@ class Tables(Enum):
 
 
 class DBUtils:
-    def __init__(self) -> None:
+    def __init__(self, dbname: str = P_DBNAME) -> None:
+        self.dbname = dbname
         self.connection = None
         self.connection_attempts = 0
         self.connect()
 
     def connect(self) -> None:
         try:
-            self.connection = psycopg2.connect( dbname = P_DBNAME, user = P_USER,
+            self.connection = psycopg2.connect( dbname = self.dbname, user = P_USER,
                                 password = P_PASSWORD, host = P_HOST, port = P_PORT)
         except Exception as e:
             print(
@@ -70,7 +76,8 @@ class DBUtils:
         try:
             with self.connection.cursor() as cursor:
                 query = sql.SQL(
-                    "INSERT INTO {} (timestamp, price) VALUES (%s, %s)").format(
+                    "INSERT INTO {} (timestamp, price) VALUES (%s, %s) "
+                    "ON CONFLICT DO NOTHING").format(
                     sql.Identifier(Tables.BTC_PRICE.value))
                 cursor.execute(query, (timestamp, price))
             self.connection.commit()
@@ -138,7 +145,8 @@ class DBUtils:
         try:
             with self.connection.cursor() as cursor:
                 query = sql.SQL(
-                    "INSERT INTO {} (timestamp, indicator_name, value, signal) VALUES (%s, %s, %s, %s)").format(
+                    "INSERT INTO {} (timestamp, indicator_name, value, signal) VALUES (%s, %s, %s, %s) "
+                    "ON CONFLICT DO NOTHING").format(
                     sql.Identifier(table.value))
                 cursor.execute(query, (timestamp, indicator_name, value, signal))
             self.connection.commit()
@@ -149,6 +157,43 @@ class DBUtils:
             print(f"Failed to add indicator: {e}")
             return False
 
+    def add_snapshots(self, snapshots: list[tuple[timestamp, float | None,
+            dict[Tables, list[tuple[str, float | None, str | None]]]]]) -> bool:
+        """
+        Add the btc prices and indicators of several minutes in one
+        transaction. Each snapshot is
+        (timestamp, price, {table: [(indicator_name, value, signal)]}).
+        Snapshots with NO_PRICE as price only add indicators.
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                prices = [(ts, price) for ts, price, _ in snapshots
+                          if price is not NO_PRICE]
+                if prices:
+                    query = sql.SQL(
+                        "INSERT INTO {} (timestamp, price) VALUES %s "
+                        "ON CONFLICT DO NOTHING").format(
+                        sql.Identifier(Tables.BTC_PRICE.value))
+                    execute_values(cursor, query, prices)
+                rows_per_table = {}
+                for ts, _, indicators in snapshots:
+                    for table, rows in indicators.items():
+                        rows_per_table.setdefault(table, []).extend(
+                            (ts, *row) for row in rows)
+                for table, rows in rows_per_table.items():
+                    query = sql.SQL(
+                        "INSERT INTO {} (timestamp, indicator_name, value, signal) VALUES %s "
+                        "ON CONFLICT DO NOTHING").format(
+                        sql.Identifier(table.value))
+                    execute_values(cursor, query, rows, page_size=1000)
+            self.connection.commit()
+            return True
+        except Exception as e:
+            if not self.is_connected():
+                self.connect()
+            print(f"Failed to add snapshots: {e}")
+            return False
+
     def delete_indicator(self, table: Tables, timestamp: timestamp) -> bool:
         """Delete the indicator from the specified table."""
         try:
@@ -197,6 +242,82 @@ class DBUtils:
             print(f"Failed to get all indicators: {e}")
             return []
 
+    def get_first_timestamp(self, table: Tables) -> timestamp | None:
+        """Get the oldest timestamp of the specified table."""
+        try:
+            with self.connection.cursor() as cursor:
+                query = sql.SQL(
+                    "SELECT min(timestamp) FROM {}").format(
+                    sql.Identifier(table.value))
+                cursor.execute(query)
+                result = cursor.fetchone()
+            return result[0] if result else None
+        except Exception as e:
+            if not self.is_connected():
+                self.connect()
+            print(f"Failed to get first timestamp: {e}")
+            return None
+
+    def get_prices_between(self, start: timestamp | None,
+            end: timestamp) -> list[tuple[timestamp, float]] | None:
+        """
+        Get btc prices with start < timestamp < end ordered by timestamp.
+        If start is None, all prices before end are returned.
+        Returns None if the query fails, so it is not mistaken for no rows.
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                if start is None:
+                    query = sql.SQL(
+                        "SELECT timestamp, price FROM {} WHERE timestamp < %s "
+                        "ORDER BY timestamp").format(
+                        sql.Identifier(Tables.BTC_PRICE.value))
+                    cursor.execute(query, (end,))
+                else:
+                    query = sql.SQL(
+                        "SELECT timestamp, price FROM {} WHERE timestamp > %s "
+                        "AND timestamp < %s ORDER BY timestamp").format(
+                        sql.Identifier(Tables.BTC_PRICE.value))
+                    cursor.execute(query, (start, end))
+                result = cursor.fetchall()
+            return result
+        except Exception as e:
+            if not self.is_connected():
+                self.connect()
+            print(f"Failed to get prices between: {e}")
+            return None
+
+    def get_indicators_between(self, table: Tables, start: timestamp | None,
+            end: timestamp) -> list[tuple[timestamp, str, float, str]] | None:
+        """
+        Get indicators with start < timestamp < end from the specified table
+        ordered by timestamp. If start is None, all rows before end are
+        returned. Returns None if the query fails, so it is not mistaken for
+        no rows.
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                if start is None:
+                    query = sql.SQL(
+                        "SELECT timestamp, indicator_name, value, signal FROM {} "
+                        "WHERE timestamp < %s ORDER BY timestamp").format(
+                        sql.Identifier(table.value))
+                    cursor.execute(query, (end,))
+                else:
+                    query = sql.SQL(
+                        "SELECT timestamp, indicator_name, value, signal FROM {} "
+                        "WHERE timestamp > %s AND timestamp < %s "
+                        "ORDER BY timestamp").format(
+                        sql.Identifier(table.value))
+                    cursor.execute(query, (start, end))
+                result = cursor.fetchall()
+            return result
+        except Exception as e:
+            if not self.is_connected():
+                self.connect()
+            print(f"Failed to get indicators between: {e}")
+            return None
+
 
 if __name__ == "__main__":
     def format_timestamp(ts: timestamp) -> timestamp:
@@ -1,9 +1,6 @@
 import os
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import copy
+import threading
 from datetime import datetime, timedelta
 
 from logger import logger
@@ -22,25 +19,72 @@ class IndicatorReceiver:
     if retrieval fails, it will return latest known status for fail_limit
     times. after that it will return None. And sends an email to the admin.
     Sends mail only once per day.
+    Selenium is imported and the browser is launched in a background thread,
+    so the rest of the process starts without waiting for them. If the launch
+    fails, it is retried on the next fetch.
     """
 
+    intervals = ['1m', '5m', '15m', '30m', '1h', '2h', '4h', '1d', '1w', '1M']
+
     def __init__(self, fail_limit: float = 2) -> None:
         self.fail_limit = fail_limit
         self.fail_count = 0
         self.last_email_sent = None
         self.status_default = self.default_status()
-        self.status = self.status_default.copy()
-        self.init_selenium()
+        self.status = copy.deepcopy(self.status_default)
+        self.driver = None
+        self.driver_ready = threading.Event()
+        self.start_selenium()
+
+    def start_selenium(self) -> None:
+        """Launch the browser in a background thread"""
+        self.driver_ready.clear()
+        threading.Thread(target=self.init_selenium, daemon=True).start()
 
     def init_selenium(self) -> None:
         """Initialize the Selenium WebDriver"""
-        # Set up the Selenium WebDriver
-        service = Service(P_PATH_TO_DRIVER)
-        options = webdriver.ChromeOptions()
-        self.driver = webdriver.Chrome(service=service, options=options)
+        try:
+            from selenium import webdriver
+            from selenium.webdriver.chrome.service import Service
+            # Set up the Selenium WebDriver
+            service = Service(P_PATH_TO_DRIVER)
+            options = webdriver.ChromeOptions()
+            self.driver = webdriver.Chrome(service=service, options=options)
+        except Exception as e:
+            logger.error(f"Failed to start the browser: {e}")
+        finally:
+            self.driver_ready.set()
+
+    def get_state(self) -> dict:
+        """Returns the state to be saved in the checkpoint file."""
+        return {
+            "status": self.status,
+            "fail_count": self.fail_count,
+            "last_email_sent": None if self.last_email_sent is None
+                else self.last_email_sent.isoformat()}
+
+    def load_state(self, state: dict, fresh: bool = True) -> None:
+        """
+        Restores the state returned by get_state().
+        The time of the last email is always restored so the alert is not
+        sent again after a restart. The last known status and the fail count
+        are only restored if the checkpoint is fresh.
+        """
+        if state.get("last_email_sent"):
+            self.last_email_sent = \
+                datetime.fromisoformat(state["last_email_sent"])
+        if not fresh:
+            return
+        self.fail_count = state.get("fail_count", 0)
+        for interval, status in state.get("status", {}).items():
+            if interval not in self.status:
+                continue
+            for indicator, t in status.items():
+                if indicator in self.status[interval]:
+                    self.status[interval][indicator] = \
+                        None if t is None else tuple(t)
 
     def default_status(self) -> dict:
-        self.intervals = ['1m', '5m', '15m', '30m', '1h', '2h', '4h', '1d', '1w', '1M']
         self.indicators = [
             'Relative Strength Index (14)',
             'Stochastic %K (14, 3, 3)',
@@ -76,6 +120,11 @@ class IndicatorReceiver:
                 status[interval][indicator] = (None, None)
         return status
 
+    def empty_status(self) -> dict:
+        """Status with every indicator missing, which counts as failed."""
+        return {interval: dict.fromkeys(self.indicators)
+                for interval in self.intervals}
+
     def get_indicators(self) -> dict:
         """
         Fetches the current status of Bitcoin indicators in tradingview.
@@ -109,7 +158,18 @@ class IndicatorReceiver:
 
     def fetch_indicators_data(self) -> dict:
         """Function to fetch indicators data from tradingview"""
-        status = self.status_default.copy()
+        if self.driver_ready.is_set() and self.driver is None:
+            # the last launch failed
+            self.start_selenium()
+        if not self.driver_ready.wait(timeout=10) or self.driver is None:
+            logger.error("Browser is not available.")
+            return self.empty_status()
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        # indicators that are not found stay None and count as failed
+        status = self.empty_status()
         try:
             # Open the target URL
             url = "https://www.tradingview.com/symbols/BTCUSD/technicals/"
@@ -0,0 +1,142 @@
+import os
+import time
+import threading
+import psycopg2
+from dotenv import load_dotenv
+
+from logger import logger
+from db_utils import P_DBNAME, P_USER, P_PASSWORD, P_HOST, P_PORT
+
+
+load_dotenv()
+P_HA_LOCK_KEY = os.getenv("P_HA_LOCK_KEY")
+
+# the server drops the session of a dead host after about
+# idle + interval * count = 11 seconds, which releases its lock
+KEEPALIVE_OPTIONS = "-c tcp_keepalives_idle=5 " \
+                    "-c tcp_keepalives_interval=2 -c tcp_keepalives_count=3"
+# how often standby instances try to acquire the lock
+STANDBY_RETRY_SECONDS = 5
+# a leader that spends longer than this on one minute releases the lock
+MAX_WORK_SECONDS = 60
+
+
+class LeaderElection:
+    """
+    This class is responsible for electing a single writer among several
+    DataLogger instances using the same database.
+    The leader holds a session level postgres advisory lock on its own
+    connection. When the leader process dies, its session ends and postgres
+    releases the lock, so one of the standby instances acquires it on its
+    next try_acquire() call. A dead host is detected by tcp keepalives.
+    A hung leader keeps its session alive, so the leader marks each minute
+    with start_work() and finish_work(), and a watchdog thread releases the
+    lock if a minute takes longer than MAX_WORK_SECONDS.
+    """
+
+    def __init__(self, lock_key: int) -> None:
+        self.lock_key = int(lock_key)
+        self.connection = None
+        self.is_leader = False
+        self.work_started = None
+        # the watchdog closes the connection from its own thread
+        self.connection_lock = threading.Lock()
+        threading.Thread(target=self.watchdog, daemon=True).start()
+
+    def connect(self) -> None:
+        self.connection = psycopg2.connect(dbname = P_DBNAME, user = P_USER,
+                        password = P_PASSWORD, host = P_HOST, port = P_PORT,
+                        keepalives_idle = 5, keepalives_interval = 2,
+                        keepalives_count = 3, options = KEEPALIVE_OPTIONS)
+        self.connection.autocommit = True
+
+    def close(self) -> None:
+        """Close the connection, which releases the lock if it is held."""
+        if self.connection:
+            self.connection.close()
+        self.connection = None
+        self.is_leader = False
+
+    def release(self, reason: str) -> None:
+        """Give up leadership so a standby can take over."""
+        with self.connection_lock:
+            if self.is_leader:
+                logger.error(f"Releasing lock {self.lock_key}: {reason}")
+            self.close()
+            self.work_started = None
+
+    def start_work(self) -> None:
+        """Mark the start of logging a minute."""
+        self.work_started = time.monotonic()
+
+    def finish_work(self) -> None:
+        """Mark the end of logging a minute."""
+        self.work_started = None
+
+    def watchdog(self) -> None:
+        """Release the lock if the leader is stuck in a minute."""
+        while True:
+            time.sleep(STANDBY_RETRY_SECONDS)
+            work_started = self.work_started
+            if self.is_leader and work_started is not None and \
+                    time.monotonic() - work_started > MAX_WORK_SECONDS:
+                self.release(
+                    f"logging a minute took over {MAX_WORK_SECONDS} seconds.")
+
+    def is_still_leader(self) -> bool:
+        """
+        Returns True if this instance is still the leader, without trying to
+        acquire the lock. Used before writing, so an instance that lost the
+        lock while fetching does not write.
+        """
+        with self.connection_lock:
+            if not self.is_leader or self.connection is None:
+                return False
+            try:
+                with self.connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            except Exception as e:
+                logger.error(f"Lost leadership for lock {self.lock_key}: {e}")
+                self.close()
+            return self.is_leader
+
+    def try_acquire(self) -> bool:
+        """
+        Returns True if this instance is the leader.
+        The leader only checks that its session, and so its lock, is still
+        alive. Other instances try to acquire the lock without blocking.
+        """
+        with self.connection_lock:
+            return self._try_acquire()
+
+    def _try_acquire(self) -> bool:
+        try:
+            if self.connection is None or self.connection.closed:
+                self.is_leader = False
+                self.connect()
+            with self.connection.cursor() as cursor:
+                if self.is_leader:
+                    cursor.execute("SELECT 1")
+                else:
+                    cursor.execute("SELECT pg_try_advisory_lock(%s)",
+                                   (self.lock_key,))
+                    if cursor.fetchone()[0]:
+                        self.is_leader = True
+                        logger.info(f"Became leader for lock {self.lock_key}.")
+        except Exception as e:
+            if self.is_leader:
+                logger.error(f"Lost leadership for lock {self.lock_key}: {e}")
+            print(f"Failed to check leadership: {e}")
+            self.close()
+        return self.is_leader
+
+
+if __name__ == "__main__":
+    # Start this in several terminals and kill the leader to see failover
+    from time import sleep
+    from datetime import datetime
+    election = LeaderElection(P_HA_LOCK_KEY or 1)
+    while True:
+        role = "leader" if election.try_acquire() else "standby"
+        print(f"{datetime.now()} pid {os.getpid()}: {role}")
+        sleep(1)
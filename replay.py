@@ -0,0 +1,316 @@
+import os
+import json
+import math
+import time
+import argparse
+from dotenv import load_dotenv
+from datetime import datetime, timedelta
+
+from logger import logger
+from db_utils import DBUtils, Tables, P_DBNAME, NO_PRICE
+from data_logger import DataLogger
+from indicator_receiver import IndicatorReceiver
+
+
+load_dotenv()
+P_REPLAY_DBNAME = os.getenv("P_REPLAY_DBNAME")
+
+
+class VirtualClock:
+    """
+    Minute clock used instead of the wall clock while replaying.
+    now() is the minute being replayed and advance() moves to the next one
+    without waiting.
+    """
+
+    def __init__(self, start: datetime, end: datetime) -> None:
+        self.current = start.replace(second=0, microsecond=0)
+        self.end = end
+
+    def now(self) -> datetime:
+        return self.current
+
+    def advance(self) -> None:
+        self.current += timedelta(minutes=1)
+
+    def finished(self) -> bool:
+        return self.current >= self.end
+
+
+class ReplayBtcReceiver:
+    """Returns the recorded price of the virtual clock's minute."""
+
+    def __init__(self, clock: VirtualClock) -> None:
+        self.clock = clock
+        self.prices = {}
+
+    def get_price(self) -> str | None:
+        return self.prices.get(self.clock.now())
+
+
+class ReplayIndicatorReceiver:
+    """Returns the recorded indicator status of the virtual clock's minute."""
+
+    def __init__(self, clock: VirtualClock) -> None:
+        self.clock = clock
+        self.statuses = {}
+
+    def get_indicators(self) -> dict:
+        return self.statuses.get(self.clock.now(), {})
+
+
+class DBSource:
+    """
+    Recorded data read from a database. Values are converted back to the
+    text the receivers return, so they go through the same parsing.
+    load() also returns the source rows, which the replay result is
+    compared against.
+    """
+
+    def __init__(self, db: DBUtils) -> None:
+        self.db = db
+
+    def load(self, start: datetime, end: datetime,
+             interval_tables: dict[str, Tables]) -> tuple[dict, dict, tuple]:
+        # get_*_between excludes start
+        after = start - timedelta(seconds=1)
+        prices, statuses = {}, {}
+        expected_prices, expected_indicators = {}, {}
+        rows = self.db.get_prices_between(after, end)
+        if rows is None:
+            raise RuntimeError(f"Failed to load source prices from {start}.")
+        for ts, price in rows:
+            prices[ts] = None if price is None else str(price)
+            expected_prices[ts] = price
+        for interval, table in interval_tables.items():
+            rows = self.db.get_indicators_between(table, after, end)
+            if rows is None:
+                raise RuntimeError(
+                    f"Failed to load source {table.value} from {start}.")
+            for ts, name, value, signal_ in rows:
+                statuses.setdefault(ts, {}).setdefault(interval, {})[name] = \
+                    (None if value is None else str(value), signal_)
+                expected_indicators[(table, ts, name)] = (value, signal_)
+        return prices, statuses, (expected_prices, expected_indicators)
+
+
+class CaptureSource:
+    """
+    Recorded data read from a file written by DataLogger with
+    P_CAPTURE_PATH set. The file is read sequentially, so load() must be
+    called with increasing time ranges. There is nothing to compare the
+    parsed values against, so load() returns None as the expected rows.
+    Captured data is keyed by interval, so interval_tables is not used.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.file = open(path)
+        self.pending = None
+
+    def load(self, start: datetime, end: datetime,
+             interval_tables: dict[str, Tables]) -> tuple[dict, dict, None]:
+        prices, statuses = {}, {}
+        while True:
+            if self.pending is None:
+                line = self.file.readline()
+                if not line:
+                    break
+                self.pending = json.loads(line)
+                self.pending["timestamp"] = \
+                    datetime.fromisoformat(self.pending["timestamp"])
+            ts = self.pending["timestamp"]
+            if ts >= end:
+                break
+            if ts >= start:
+                prices[ts] = self.pending["price"]
+                statuses[ts] = self.pending["indicators"]
+            self.pending = None
+        return prices, statuses, None
+
+
+def _same_value(a, b) -> bool:
+    if a is None or b is None:
+        return a is None and b is None
+    if isinstance(a, str) or isinstance(b, str):
+        try:
+            a, b = float(a), float(b)
+        except ValueError:
+            return a == b
+    return math.isclose(float(a), float(b), rel_tol=1e-12)
+
+
+def compare(expected: dict, actual: dict) -> tuple[int, int, int]:
+    """Returns the number of missing, extra and different rows."""
+    missing = extra = different = 0
+    for key, value in expected.items():
+        if key not in actual:
+            missing += 1
+        elif not isinstance(value, tuple) and \
+                not _same_value(value, actual[key]):
+            different += 1
+        elif isinstance(value, tuple) and \
+                not all(_same_value(a, b) for a, b in zip(value, actual[key])):
+            different += 1
+    for key in actual:
+        if key not in expected:
+            extra += 1
+    return missing, extra, different
+
+
+class Replayer:
+    """
+    This class replays recorded data through DataLogger's parse and persist
+    path as fast as possible. A virtual clock steps through the minutes,
+    replay receivers return the recorded data of the current minute and
+    the parsed minutes are written to the target database in batches.
+    The source is loaded and verified one day at a time.
+    The target database should not contain the replayed range beforehand,
+    otherwise existing rows are reported as differences.
+    """
+
+    def __init__(self, source: DBSource | CaptureSource, target_db: DBUtils,
+                 batch_minutes: int = 60, verify: bool = True) -> None:
+        self.source = source
+        self.target_db = target_db
+        self.batch_minutes = batch_minutes
+        self.verify = verify
+
+    def run(self, start: datetime, end: datetime) -> dict:
+        """Replay the minutes in [start, end) and return the statistics."""
+        clock = VirtualClock(start, end)
+        btc_receiver = ReplayBtcReceiver(clock)
+        indicator_receiver = ReplayIndicatorReceiver(clock)
+        data_logger = DataLogger(btc_receiver=btc_receiver,
+            indicator_receiver=indicator_receiver, db=self.target_db)
+        self.interval_tables = {
+            interval: data_logger.interval_to_table(interval)
+            for interval in IndicatorReceiver.intervals}
+        stats = {"minutes": 0, "rows": 0, "failed_batches": 0,
+                 "load_time": 0.0, "parse_time": 0.0, "write_time": 0.0,
+                 "verify_time": 0.0, "missing": 0, "extra": 0, "different": 0}
+        st_ = time.perf_counter()
+
+        while not clock.finished():
+            chunk_start = clock.now()
+            chunk_end = min(chunk_start + timedelta(days=1), end)
+            t = time.perf_counter()
+            prices, statuses, expected = self.source.load(
+                chunk_start, chunk_end, self.interval_tables)
+            btc_receiver.prices = prices
+            indicator_receiver.statuses = statuses
+            stats["load_time"] += time.perf_counter() - t
+
+            written_prices, written_indicators = {}, {}
+            batch = []
+            while clock.now() < chunk_end:
+                ts = clock.now()
+                # minutes missing in the source are not replayed
+                if ts in prices or ts in statuses:
+                    # a minute without a recorded price gets no price row,
+                    # unlike a recorded NULL price
+                    price = btc_receiver.get_price() if ts in prices \
+                        else NO_PRICE
+                    t = time.perf_counter()
+                    snapshot = data_logger.parse_data(ts, price,
+                        indicator_receiver.get_indicators())
+                    stats["parse_time"] += time.perf_counter() - t
+                    batch.append(snapshot)
+                    if price is not NO_PRICE:
+                        written_prices[ts] = snapshot[1]
+                    for table, rows in snapshot[2].items():
+                        for name, value, signal_ in rows:
+                            written_indicators[(table, ts, name)] = \
+                                (value, signal_)
+                clock.advance()
+                if len(batch) >= self.batch_minutes or \
+                        (batch and clock.now() >= chunk_end):
+                    self.write_batch(batch, stats)
+                    batch = []
+
+            if self.verify:
+                t = time.perf_counter()
+                if expected is None:
+                    expected = (written_prices, written_indicators)
+                self.verify_chunk(chunk_start, chunk_end, expected, stats)
+                stats["verify_time"] += time.perf_counter() - t
+
+        stats["elapsed"] = time.perf_counter() - st_
+        return stats
+
+    def write_batch(self, batch: list, stats: dict) -> None:
+        t = time.perf_counter()
+        if self.target_db.add_snapshots(batch):
+            stats["minutes"] += len(batch)
+            stats["rows"] += sum((s[1] is not NO_PRICE) +
+                                 sum(len(rows) for rows in s[2].values())
+                                 for s in batch)
+        else:
+            stats["failed_batches"] += 1
+            logger.error(f"Replay failed to write batch at {batch[0][0]}.")
+        stats["write_time"] += time.perf_counter() - t
+
+    def verify_chunk(self, start: datetime, end: datetime, expected: tuple,
+                     stats: dict) -> None:
+        """Compare the target database rows of [start, end) with expected."""
+        after = start - timedelta(seconds=1)
+        expected_prices, expected_indicators = expected
+        rows = self.target_db.get_prices_between(after, end)
+        if rows is None:
+            raise RuntimeError(f"Failed to read replayed prices from {start}.")
+        actual_prices = dict(rows)
+        actual_indicators = {}
+        for table in self.interval_tables.values():
+            rows = self.target_db.get_indicators_between(table, after, end)
+            if rows is None:
+                raise RuntimeError(
+                    f"Failed to read replayed {table.value} from {start}.")
+            for ts, name, value, signal_ in rows:
+                actual_indicators[(table, ts, name)] = (value, signal_)
+        for expected_rows, actual_rows in \
+                [(expected_prices, actual_prices),
+                 (expected_indicators, actual_indicators)]:
+            missing, extra, different = compare(expected_rows, actual_rows)
+            stats["missing"] += missing
+            stats["extra"] += extra
+            stats["different"] += different
+
+
+def print_report(stats: dict) -> None:
+    elapsed = max(stats["elapsed"], 1e-9)
+    print(f"Replayed {stats['minutes']} minutes, {stats['rows']} rows "
+          f"in {elapsed:.1f} s.")
+    print(f"Throughput: {stats['minutes'] / elapsed:.1f} minutes/s, "
+          f"{stats['rows'] / elapsed:.0f} rows/s, "
+          f"{stats['minutes'] * 60 / elapsed:.0f}x real time.")
+    print(f"Load {stats['load_time']:.1f} s, parse {stats['parse_time']:.1f} s, "
+          f"write {stats['write_time']:.1f} s, "
+          f"verify {stats['verify_time']:.1f} s.")
+    if stats["failed_batches"]:
+        print(f"Failed batches: {stats['failed_batches']}")
+    print(f"Missing rows: {stats['missing']}, extra rows: {stats['extra']}, "
+          f"different rows: {stats['different']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay recorded data into the P_REPLAY_DBNAME database.")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--capture", help="capture file to replay, "
+                        "the P_DBNAME database is replayed by default")
+    parser.add_argument("--batch-minutes", type=int, default=60)
+    parser.add_argument("--no-verify", action="store_true")
+    args = parser.parse_args()
+
+    if not P_REPLAY_DBNAME or P_REPLAY_DBNAME == P_DBNAME:
+        raise ValueError("P_REPLAY_DBNAME must be set to a database "
+                         "other than P_DBNAME.")
+    target_db = DBUtils(P_REPLAY_DBNAME)
+    if args.capture:
+        source = CaptureSource(args.capture)
+    else:
+        source = DBSource(DBUtils())
+    replayer = Replayer(source, target_db, args.batch_minutes,
+                        not args.no_verify)
+    print_report(replayer.run(args.start, args.end))
+    target_db.close()